@@ -1,23 +1,51 @@
 import os
-import json
+import re
+import multiprocessing
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 import ebooklib
 from ebooklib import epub
-from bs4 import BeautifulSoup
-from typing import List, Dict
+from selectolax.parser import HTMLParser
+from typing import List, Dict, Union
+from json_utils import dump_json
 
-def clean_html_content(html_content: str) -> str:
-    """清理HTML内容，提取纯文本"""
-    soup = BeautifulSoup(html_content, 'html.parser')
+# 子进程以spawn方式启动：parse_epub可能在图形界面的后台线程中调用，
+# 在多线程进程中fork可能导致子进程死锁
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# 换行符或连续两个空格（连同两侧空白）视为一处断行
+_LINE_BREAK_RE = re.compile(r'\s*(?:[\n\r\v\f\x1c-\x1e\x85\u2028\u2029]|  )\s*')
+
+# 句末标点之后的位置，用于拆分超长段落
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？.!?])')
+
+def clean_html_content(html_content: Union[str, bytes]) -> str:
+    """清理HTML内容，提取纯文本（bytes按UTF-8解析）"""
+    tree = HTMLParser(html_content)
+    if tree.root is None:
+        return ""
     # 移除script和style标签
-    for script in soup(["script", "style"]):
-        script.decompose()
+    tree.strip_tags(["script", "style"])
     # 获取文本
-    text = soup.get_text()
-    # 清理空白字符
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = '\n'.join(chunk for chunk in chunks if chunk)
-    return text
+    text = tree.root.text()
+    # 清理空白字符：去掉每行首尾空白和空行，连续两个空格处也断行
+    return _LINE_BREAK_RE.sub('\n', text).strip()
+
+def _split_long_paragraph(para: str, chunk_size: int) -> List[str]:
+    """将超过chunk_size的段落按句子边界拆分，单句仍超长时按长度截断"""
+    pieces = []
+    current = ''
+    for sentence in _SENTENCE_END_RE.split(para):
+        if len(current) + len(sentence) > chunk_size and current:
+            pieces.append(current)
+            current = ''
+        while len(sentence) > chunk_size:
+            pieces.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
 
 def split_content(text: str, chunk_size: int = 2000) -> List[str]:
     """将文本按照指定大小分块
@@ -37,15 +65,25 @@ def split_content(text: str, chunk_size: int = 2000) -> List[str]:
     
     for para in paragraphs:
         para_size = len(para)
-        if current_size + para_size > chunk_size and current_chunk:
-            # 当前块已满，保存并开始新的块
-            chunks.append('\n'.join(current_chunk))
-            current_chunk = [para]
-            current_size = para_size
+        if para_size > chunk_size:
+            # 超长段落先按句子拆分，保证每块不超过chunk_size
+            pieces = _split_long_paragraph(para, chunk_size)
         else:
-            # 添加到当前块
-            current_chunk.append(para)
-            current_size += para_size
+            pieces = (para,)
+        
+        for piece in pieces:
+            piece_size = len(piece)
+            # 块内各段以换行符连接，分隔符也计入块的长度
+            added_size = piece_size + 1 if current_chunk else piece_size
+            if current_size + added_size > chunk_size and current_chunk:
+                # 当前块已满，保存并开始新的块
+                chunks.append('\n'.join(current_chunk))
+                current_chunk = [piece]
+                current_size = piece_size
+            else:
+                # 添加到当前块
+                current_chunk.append(piece)
+                current_size += added_size
     
     # 处理最后一个块
     if current_chunk:
@@ -53,12 +91,24 @@ def split_content(text: str, chunk_size: int = 2000) -> List[str]:
     
     return chunks
 
-def parse_epub(epub_path: str, output_dir: str = "sep_pages") -> Dict[str, List[Dict]]:
+def _clean_and_split(html_content: bytes) -> List[str]:
+    """清理单个章节的HTML并分块，供进程池调用"""
+    clean_text = clean_html_content(html_content)
+    if not clean_text.strip():
+        return []
+    return split_content(clean_text)
+
+def parse_epub(
+    epub_path: str, 
+    output_dir: str = "sep_pages", 
+    max_workers: int = None
+) -> Dict[str, List[Dict]]:
     """解析EPUB文件并按块保存内容
     
     Args:
         epub_path: EPUB文件路径
         output_dir: 输出目录
+        max_workers: 并行解析章节的进程数，默认使用全部CPU核心，为1时在当前进程中依次解析
         
     Returns:
         解析结果的信息
@@ -71,7 +121,7 @@ def parse_epub(epub_path: str, output_dir: str = "sep_pages") -> Dict[str, List[
     # 读取EPUB文件
     book = epub.read_epub(epub_path)
     
-    # 收集处理结果
+    # 收集处理结果，块内容只保存在数据库中，这里仅记录索引信息
     result = {
         'book_name': book_name,
         'chapters': []
@@ -79,47 +129,68 @@ def parse_epub(epub_path: str, output_dir: str = "sep_pages") -> Dict[str, List[
     
     chunk_index = 1
     
-    # 处理每个文档
-    for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-        if not item.is_chapter():
-            continue
-            
-        # 获取章节内容
-        html_content = item.get_content().decode('utf-8')
-        clean_text = clean_html_content(html_content)
-        
-        if not clean_text.strip():
-            continue
-            
-        # 分割内容
-        chunks = split_content(clean_text)
+    # 收集所有章节，直接将原始字节交给解析器，避免再复制一份解码后的字符串
+    chapters = [
+        item for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT)
+        if item.is_chapter()
+    ]
+    contents = [item.get_content() for item in chapters]
+    
+    # 清理和分块互不依赖，章节较多时分配到多个进程并行处理
+    pool = None
+    if max_workers != 1 and len(chapters) > 1:
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT)
+    
+    # 所有块保存在同一个SQLite数据库中，逐章写入，最后统一提交
+    conn = sqlite3.connect(os.path.join(book_dir, 'chunks.db'))
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("DROP TABLE IF EXISTS chunks")
+        conn.execute(
+            "CREATE TABLE chunks ("
+            "chunk_index INTEGER PRIMARY KEY, "
+            "chapter TEXT, "
+            "chapter_chunk_index INTEGER, "
+            "content TEXT)"
+        )
         
-        chapter_info = {
-            'title': item.get_name(),
-            'chunks': []
-        }
+        if pool is not None:
+            chapter_chunks = pool.map(_clean_and_split, contents, chunksize=4)
+        else:
+            chapter_chunks = map(_clean_and_split, contents)
         
-        # 保存每个块
-        for i, chunk in enumerate(chunks, 1):
-            chunk_data = {
-                'content': chunk,
-                'chunk_index': chunk_index,
-                'chapter_chunk_index': i
+        # 按章节顺序统一编号
+        for item, chunks in zip(chapters, chapter_chunks):
+            if not chunks:
+                continue
+            
+            chapter_info = {
+                'title': item.get_name(),
+                'chunks': []
             }
             
-            # 保存到文件
-            output_file = os.path.join(book_dir, f'chunk_{chunk_index:04d}.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(chunk_data, f, ensure_ascii=False, indent=2)
+            chunk_rows = []
+            for i, chunk in enumerate(chunks, 1):
+                chunk_rows.append((chunk_index, chapter_info['title'], i, chunk))
+                chapter_info['chunks'].append({
+                    'chunk_index': chunk_index,
+                    'chapter_chunk_index': i,
+                    'length': len(chunk)
+                })
+                chunk_index += 1
             
-            chapter_info['chunks'].append(chunk_data)
-            chunk_index += 1
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+            result['chapters'].append(chapter_info)
         
-        result['chapters'].append(chapter_info)
+        conn.commit()
+    finally:
+        conn.close()
+        if pool is not None:
+            pool.shutdown()
     
     # 保存处理信息
     info_file = os.path.join(book_dir, 'book_info.json')
-    with open(info_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    dump_json(result, info_file)
     
     return result 
\ No newline at end of file
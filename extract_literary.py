@@ -1,15 +1,79 @@
 import os
-import json
+import re
+import sqlite3
 import time
+import hashlib
+import shutil
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional
 from openai import OpenAI
 import dashscope
 from http import HTTPStatus
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from json_utils import loads, load_json
+
+# 提示词的固定部分在前、页面文本在后，使各次请求共享相同的前缀，
+# 以便命中服务端的前缀缓存（Deepseek自动缓存，OpenAI按PROMPT_CACHE_KEY路由）。
+# 修改提示词时请同步更新PROMPT_CACHE_KEY
+PROMPT_CACHE_KEY = "literary_extract_v1"
+
+# 单页提取的用户提示词
+EXTRACT_PROMPT = "请从以下文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行：\n\n{text}"
+
+# 多页合并提取的用户提示词，每页结果之间以BATCH_SEPARATOR分隔
+BATCH_SEPARATOR = "###END###"
+BATCH_EXTRACT_PROMPT = (
+    "请分别从以下各页文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行。"
+    "请按页面顺序为每页输出一个结果块，每个结果块之后单独一行写上'" + BATCH_SEPARATOR + "'，"
+    "某页没有文学性句子时该结果块留空。\n\n共{count}页：\n\n{pages}"
+)
+
+# 流式输出中途中断时追加在已输出内容之后的说明
+STREAM_INTERRUPTED_NOTE = "\n（模型输出中断，本页结果不完整）"
+
+# 页面文件名中的页码，如page_0001.json
+_PAGE_FILE_RE = re.compile(r'_(\d+)\.json$')
+
+_PAGE_HEADER_RE = re.compile(r'^\s*### PAGE \d+ ###\s*')
+
+def split_batch_response(response: str, count: int) -> Optional[List[str]]:
+    """
+    将多页合并提取的返回结果拆分为每页的结果
+    
+    Returns:
+        与页面一一对应的结果列表，块数与count不符时返回None
+    """
+    blocks = response.split(BATCH_SEPARATOR)
+    # 最后一个分隔符之后通常只剩空白
+    if len(blocks) == count + 1 and not blocks[-1].strip():
+        blocks.pop()
+    if len(blocks) != count:
+        return None
+    return [_PAGE_HEADER_RE.sub('', block).strip() for block in blocks]
+
+def create_http_session() -> requests.Session:
+    """创建复用连接的HTTP会话，对限流和服务端错误自动重试"""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST"])
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
 
 class ModelAdapter(ABC):
     """模型适配器基类"""
+    # 实际调用的模型，作为结果缓存键的一部分
+    model_name = ""
+    
     def __init__(self):
         self.system_prompt = "你是一个专业的文学鉴赏家，善于发现文本中富有文学性的句子。这些句子应该具有优美的意境、独特的比喻、生动的描写或深刻的哲理。"
     
@@ -17,50 +81,149 @@ class ModelAdapter(ABC):
     def extract_sentences(self, text: str, system_prompt: str = None) -> str:
         """从文本中提取文学性句子"""
         pass
+    
+    def batch_extract_sentences(self, pages: List[str], system_prompt: str = None) -> Optional[List[str]]:
+        """
+        从多页文本中分别提取文学性句子
+        
+        Returns:
+            与pages一一对应的结果；合并请求的回复无法按页拆分时返回None，
+            由调用方改为逐页请求
+        """
+        return [self.extract_sentences(text, system_prompt) for text in pages]
+    
+    def extract_sentences_stream(self, text: str, system_prompt: str = None) -> Iterator[str]:
+        """以流式方式逐段返回提取结果，默认一次性返回完整结果"""
+        result = self.extract_sentences(text, system_prompt)
+        if result:
+            yield result
+    
+    def _batch_chat(
+        self, 
+        chat: Callable[[str, str], str], 
+        pages: List[str], 
+        system_prompt: str = None
+    ) -> Optional[List[str]]:
+        """
+        将多页文本合并为一次请求，供支持多页合并的适配器在batch_extract_sentences中调用
+        
+        Args:
+            chat: 发送一次对话请求的函数，参数为(system_prompt, user_content)，
+                返回模型回复，出错时返回空字符串
+            pages: 各页文本
+            system_prompt: 系统提示词
+        
+        Returns:
+            与pages一一对应的结果；调用失败时各页为空字符串，结果块数不符时返回None
+        """
+        if len(pages) < 2:
+            return ModelAdapter.batch_extract_sentences(self, pages, system_prompt)
+        
+        pages_text = "\n\n".join(
+            f"### PAGE {i} ###\n{text}" for i, text in enumerate(pages, 1)
+        )
+        response = chat(
+            system_prompt or self.system_prompt,
+            BATCH_EXTRACT_PROMPT.format(count=len(pages), pages=pages_text)
+        )
+        # 调用失败（如被限流）时不再逐页重试，避免请求数成倍增加
+        if not response:
+            return [""] * len(pages)
+        return split_batch_response(response, len(pages))
 
 class OpenAIAdapter(ModelAdapter):
     """OpenAI模型适配器"""
+    model_name = "gpt-3.5-turbo"
+    
     def __init__(self, api_key: str):
         super().__init__()
         self.client = OpenAI(api_key=api_key)
     
     def extract_sentences(self, text: str, system_prompt: str = None) -> str:
+        return self._chat(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def batch_extract_sentences(self, pages: List[str], system_prompt: str = None) -> Optional[List[str]]:
+        return self._batch_chat(self._chat, pages, system_prompt)
+    
+    def extract_sentences_stream(self, text: str, system_prompt: str = None) -> Iterator[str]:
+        return self._chat_stream(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def _chat(self, system_prompt: str, user_content: str) -> str:
         try:
             response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=self.model_name,
                 messages=[
-                    {"role": "system", "content": system_prompt or self.system_prompt},
-                    {"role": "user", "content": f"请从以下文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行：\n\n{text}"}
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
                 ],
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=1000,
+                extra_body={"prompt_cache_key": PROMPT_CACHE_KEY}
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"OpenAI API调用出错: {str(e)}")
             return ""
+    
+    def _chat_stream(self, system_prompt: str, user_content: str) -> Iterator[str]:
+        """流式返回模型回复，调用出错或输出没有正常结束时抛出异常"""
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            temperature=0.7,
+            max_tokens=1000,
+            stream=True,
+            extra_body={"prompt_cache_key": PROMPT_CACHE_KEY}
+        )
+        finished = False
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                yield choice.delta.content
+            # 最后一段带有finish_reason，没有收到时说明输出被中断
+            if choice.finish_reason:
+                finished = True
+        if not finished:
+            raise RuntimeError("OpenAI流式输出未正常结束")
 
 class DeepseekAdapter(ModelAdapter):
     """Deepseek模型适配器"""
+    model_name = "deepseek-chat"
+    
     def __init__(self, api_key: str):
         super().__init__()
         self.api_key = api_key
         self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        self.session = create_http_session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
     
     def extract_sentences(self, text: str, system_prompt: str = None) -> str:
+        return self._chat(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def batch_extract_sentences(self, pages: List[str], system_prompt: str = None) -> Optional[List[str]]:
+        return self._batch_chat(self._chat, pages, system_prompt)
+    
+    def extract_sentences_stream(self, text: str, system_prompt: str = None) -> Iterator[str]:
+        return self._chat_stream(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def _chat(self, system_prompt: str, user_content: str) -> str:
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
             data = {
-                "model": "deepseek-chat",
+                "model": self.model_name,
                 "messages": [
-                    {"role": "system", "content": system_prompt or self.system_prompt},
-                    {"role": "user", "content": f"请从以下文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行：\n\n{text}"}
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
                 ]
             }
-            response = requests.post(self.api_url, headers=headers, json=data)
+            response = self.session.post(self.api_url, json=data)
             if response.status_code == 200:
                 return response.json()["choices"][0]["message"]["content"].strip()
             else:
@@ -69,20 +232,50 @@ class DeepseekAdapter(ModelAdapter):
         except Exception as e:
             print(f"Deepseek API调用出错: {str(e)}")
             return ""
+    
+    def _chat_stream(self, system_prompt: str, user_content: str) -> Iterator[str]:
+        """流式返回模型回复，调用出错或没有收到[DONE]时抛出异常"""
+        data = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "stream": True
+        }
+        with self.session.post(self.api_url, json=data, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Deepseek API调用失败: {response.status_code}")
+            # 按SSE格式逐行解析，每行形如"data: {...}"
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                payload = line[len(b"data: "):]
+                if payload == b"[DONE]":
+                    return
+                delta = loads(payload)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+        raise RuntimeError("Deepseek流式输出未正常结束")
 
 class ErnieAdapter(ModelAdapter):
     """文心一言模型适配器"""
+    # 由请求地址决定，chat/completions对应ERNIE-Bot
+    model_name = "ERNIE-Bot"
+    
     def __init__(self, api_key: str, secret_key: str):
         super().__init__()
         self.api_key = api_key
         self.secret_key = secret_key
+        self.session = create_http_session()
+        self.session.headers.update({"Content-Type": "application/json"})
         self.access_token = self._get_access_token()
     
     def _get_access_token(self) -> Optional[str]:
         """获取文心一言访问令牌"""
         url = f"https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.secret_key}"
         try:
-            response = requests.get(url)
+            response = self.session.get(url)
             if response.status_code == 200:
                 return response.json().get("access_token")
             return None
@@ -91,25 +284,31 @@ class ErnieAdapter(ModelAdapter):
             return None
     
     def extract_sentences(self, text: str, system_prompt: str = None) -> str:
+        return self._chat(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def batch_extract_sentences(self, pages: List[str], system_prompt: str = None) -> Optional[List[str]]:
+        return self._batch_chat(self._chat, pages, system_prompt)
+    
+    def _chat(self, system_prompt: str, user_content: str) -> str:
+        # 适配器会被复用，之前获取令牌失败时重新获取
+        if not self.access_token:
+            self.access_token = self._get_access_token()
         if not self.access_token:
             print("文心一言access_token无效")
             return ""
         
         try:
             url = "https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions"
-            headers = {
-                "Content-Type": "application/json"
-            }
             params = {
                 "access_token": self.access_token
             }
             data = {
                 "messages": [
-                    {"role": "system", "content": system_prompt or self.system_prompt},
-                    {"role": "user", "content": f"请从以下文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行：\n\n{text}"}
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
                 ]
             }
-            response = requests.post(url, headers=headers, params=params, json=data)
+            response = self.session.post(url, params=params, json=data)
             if response.status_code == 200:
                 return response.json()["result"].strip()
             else:
@@ -121,35 +320,225 @@ class ErnieAdapter(ModelAdapter):
 
 class QianwenAdapter(ModelAdapter):
     """通义千问模型适配器"""
+    model_name = "qwen-turbo"
+    
     def __init__(self, api_key: str):
         super().__init__()
-        dashscope.api_key = api_key
+        # 每次调用时传入密钥，不修改dashscope的全局配置
+        self.api_key = api_key
     
     def extract_sentences(self, text: str, system_prompt: str = None) -> str:
+        return self._chat(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def batch_extract_sentences(self, pages: List[str], system_prompt: str = None) -> Optional[List[str]]:
+        return self._batch_chat(self._chat, pages, system_prompt)
+    
+    def extract_sentences_stream(self, text: str, system_prompt: str = None) -> Iterator[str]:
+        return self._chat_stream(system_prompt or self.system_prompt, EXTRACT_PROMPT.format(text=text))
+    
+    def _chat(self, system_prompt: str, user_content: str) -> str:
+        # 只有完整接收到输出时才返回结果，中途出错时返回空字符串
         try:
-            response = dashscope.Generation.call(
-                model='qwen-turbo',
-                messages=[
-                    {'role': 'system', 'content': system_prompt or self.system_prompt},
-                    {'role': 'user', 'content': f'请从以下文本中提取出具有文学性的句子，直接列出句子即可，每个句子单独一行：\n\n{text}'}
-                ]
-            )
-            if response.status_code == HTTPStatus.OK:
-                return response.output.text.strip()
-            else:
-                print(f"通义千问API调用失败: {response.status_code}")
-                return ""
+            return ''.join(self._chat_stream(system_prompt, user_content)).strip()
         except Exception as e:
             print(f"通义千问API调用出错: {str(e)}")
             return ""
+    
+    def _chat_stream(self, system_prompt: str, user_content: str) -> Iterator[str]:
+        """流式返回模型回复，调用出错或输出没有正常结束时抛出异常"""
+        responses = dashscope.Generation.call(
+            model=self.model_name,
+            messages=[
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_content}
+            ],
+            api_key=self.api_key,
+            stream=True,
+            incremental_output=True
+        )
+        finished = False
+        for response in responses:
+            if response.status_code != HTTPStatus.OK:
+                raise RuntimeError(f"请求失败，状态码 {response.status_code}")
+            if response.output.text:
+                yield response.output.text
+            # 输出未结束时finish_reason为"null"，最后一段为"stop"等
+            if response.output.finish_reason not in (None, "null"):
+                finished = True
+        if not finished:
+            raise RuntimeError("流式输出未正常结束")
+
+class ResponseCache:
+    """模型结果缓存，以输入内容的哈希为键保存在SQLite数据库中"""
+    def __init__(self, cache_dir: str = "cache"):
+        os.makedirs(cache_dir, exist_ok=True)
+        # 多个工作线程共用同一个连接，读写时加锁
+        self.conn = sqlite3.connect(
+            os.path.join(cache_dir, "responses.db"),
+            check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.commit()
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """根据各部分内容计算缓存键"""
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, value))
+            self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class RateLimiter:
+    """令牌桶限流器，按每分钟请求数（RPM）控制调用频率，可在多个线程间共享"""
+    def __init__(self, rpm: float, burst: int = 1):
+        """
+        Args:
+            rpm: 每分钟最多请求数
+            burst: 桶容量，即空闲后最多可连续发出的请求数；默认为1，
+                请求严格按60/rpm秒的间隔发出，任意一分钟内不超过rpm次
+        """
+        self.rate = max(1.0, float(rpm)) / 60  # 每秒补充的令牌数
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """获取一个令牌，超出频率限制时等待"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # 先预留令牌再等待，令牌数为负表示排在前面的请求还未轮到
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
 
 class LiteraryExtractor:
     """文学句子提取器"""
-    def __init__(self, model_adapter: ModelAdapter):
+    def __init__(
+        self, 
+        model_adapter: ModelAdapter, 
+        cache: ResponseCache = None,
+        rate_limiter: RateLimiter = None
+    ):
         self.model_adapter = model_adapter
+        self.cache = cache
+        # 每次实际调用模型前获取令牌，命中缓存时不占用
+        self.rate_limiter = rate_limiter
+    
+    def _cache_key(self, text: str, system_prompt: str = None, batch: bool = False) -> str:
+        """
+        计算缓存键
+        
+        键中包含提示词版本、模型和用户提示词模板，修改提示词或更换模型后不会命中旧结果；
+        合并请求与逐页请求的结果分开缓存
+        """
+        return ResponseCache.make_key(
+            PROMPT_CACHE_KEY,
+            type(self.model_adapter).__name__,
+            self.model_adapter.model_name,
+            "batch" if batch else "single",
+            BATCH_EXTRACT_PROMPT if batch else EXTRACT_PROMPT,
+            system_prompt or self.model_adapter.system_prompt,
+            text
+        )
+    
+    def _acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
     
     def extract_literary_sentences(self, text: str, system_prompt: str = None) -> str:
-        return self.model_adapter.extract_sentences(text, system_prompt)
+        if self.cache is None:
+            self._acquire()
+            return self.model_adapter.extract_sentences(text, system_prompt)
+        
+        key = self._cache_key(text, system_prompt)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        
+        self._acquire()
+        result = self.model_adapter.extract_sentences(text, system_prompt)
+        # 调用失败时返回空字符串，不写入缓存
+        if result:
+            self.cache.set(key, result)
+        return result
+    
+    def extract_literary_sentences_stream(self, text: str, system_prompt: str = None) -> Iterator[str]:
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(text, system_prompt)
+            result = self.cache.get(key)
+            if result is not None:
+                yield result
+                return
+        
+        self._acquire()
+        parts = []
+        try:
+            for part in self.model_adapter.extract_sentences_stream(text, system_prompt):
+                parts.append(part)
+                yield part
+        except Exception as e:
+            # 输出中途中断时结果不完整，在输出中注明，且不写入缓存
+            print(f"模型流式输出中断: {str(e)}")
+            if parts:
+                yield STREAM_INTERRUPTED_NOTE
+            return
+        
+        result = ''.join(parts).strip()
+        if key is not None and result:
+            self.cache.set(key, result)
+    
+    def batch_extract_literary_sentences(self, pages: List[str], system_prompt: str = None) -> List[str]:
+        if self.cache is None:
+            keys = None
+            results = [None] * len(pages)
+        else:
+            # 只对未命中缓存的页面发起请求
+            keys = [self._cache_key(text, system_prompt, batch=True) for text in pages]
+            results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        self._acquire()
+        fresh = self.model_adapter.batch_extract_sentences(
+            [pages[i] for i in missing], system_prompt
+        )
+        if fresh is None:
+            # 合并请求的回复无法按页拆分，改为逐页请求，每页单独获取令牌
+            print(f"合并请求的结果块数与页数（{len(missing)}）不符，改为逐页请求")
+            for i in missing:
+                results[i] = self.extract_literary_sentences(pages[i], system_prompt)
+            return results
+        
+        for i, result in zip(missing, fresh):
+            results[i] = result
+            if keys is not None and result:
+                self.cache.set(keys[i], result)
+        return results
 
 def create_model_adapter(model_type: str, **kwargs) -> ModelAdapter:
     """
@@ -172,13 +561,45 @@ def create_model_adapter(model_type: str, **kwargs) -> ModelAdapter:
     
     return adapter_creator()
 
+@lru_cache(maxsize=8)
+def get_model_adapter(model_type: str, api_key: str, secret_key: str = None) -> ModelAdapter:
+    """
+    获取模型适配器，相同模型和密钥重复调用时复用已创建的适配器及其HTTP连接
+    
+    Args:
+        model_type: 模型类型 ('openai', 'deepseek', 'ernie', 'qianwen')
+        api_key: API密钥
+        secret_key: Secret Key（仅文心一言需要）
+    """
+    return create_model_adapter(model_type, api_key=api_key, secret_key=secret_key)
+
+def copy_file_contents(src, dst):
+    """将已打开的src文件内容全部复制到dst，支持时直接在内核中完成复制"""
+    offset = 0
+    if hasattr(os, "sendfile"):
+        size = os.fstat(src.fileno()).st_size
+        dst.flush()
+        try:
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError:
+            # 部分平台不支持向普通文件sendfile，从已复制的位置继续
+            src.seek(offset)
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+
 class OutputManager:
     """输出管理器，处理不同的存储策略"""
     def __init__(self, output_dir: str, pdf_name: str, dump_interval: int = 10):
         self.output_dir = output_dir
         self.pdf_name = pdf_name
         self.dump_interval = dump_interval
-        self.current_batch = []
+        # 当前批次的页码和内容分别存放在两个列表中
+        self.batch_pages = []
+        self.batch_contents = []
         self.batch_count = 0
         self.temp_files = []
         
@@ -189,19 +610,23 @@ class OutputManager:
     def add_content(self, page_number: int, content: str):
         """添加页面内容"""
         if content:
-            self.current_batch.append((page_number, content))
+            self.batch_pages.append(page_number)
+            self.batch_contents.append(content)
     
-    def _write_batch(self, filename: str, batch: list):
-        """写入一批内容到文件"""
+    @staticmethod
+    def _format_page(page_number: int, content: str) -> str:
+        """格式化单页输出内容"""
+        return f"\n=== 第{page_number}页 ===\n{content}\n"
+    
+    def _write_batch(self, filename: str, pages: list, contents: list):
+        """按页码顺序将一批内容写入文件"""
+        order = sorted(range(len(pages)), key=pages.__getitem__)
         with open(filename, "w", encoding="utf-8") as f:
-            for page_num, content in sorted(batch, key=lambda x: x[0]):
-                f.write(f"\n=== 第{page_num}页 ===\n")
-                f.write(content)
-                f.write("\n")
+            f.write(''.join(self._format_page(pages[i], contents[i]) for i in order))
     
     def dump_interval_batch(self):
         """按间隔导出当前批次内容"""
-        if not self.current_batch:
+        if not self.batch_pages:
             return
             
         self.batch_count += 1
@@ -209,17 +634,18 @@ class OutputManager:
             self.pdf_output_dir, 
             f"temp_batch_{self.batch_count:03d}.txt"
         )
-        self._write_batch(temp_file, self.current_batch)
+        self._write_batch(temp_file, self.batch_pages, self.batch_contents)
         self.temp_files.append(temp_file)
-        self.current_batch = []
+        self.batch_pages = []
+        self.batch_contents = []
     
     def merge_and_cleanup(self, page_range: str = ""):
         """合并所有临时文件并清理"""
-        if not self.temp_files and not self.current_batch:
+        if not self.temp_files and not self.batch_pages:
             return
             
         # 处理最后一批数据
-        if self.current_batch:
+        if self.batch_pages:
             self.dump_interval_batch()
         
         # 合并所有临时文件
@@ -228,10 +654,10 @@ class OutputManager:
             f"{self.pdf_name}{page_range}_literary.txt"
         )
         
-        with open(output_file, "w", encoding="utf-8") as outf:
+        with open(output_file, "wb") as outf:
             for temp_file in sorted(self.temp_files):
-                with open(temp_file, "r", encoding="utf-8") as inf:
-                    outf.write(inf.read())
+                with open(temp_file, "rb") as inf:
+                    copy_file_contents(inf, outf)
                 os.remove(temp_file)
         
         self.temp_files = []
@@ -247,118 +673,236 @@ class OutputManager:
         )
         
         with open(output_file, "a", encoding="utf-8") as f:
-            f.write(f"\n=== 第{page_number}页 ===\n")
-            f.write(content)
-            f.write("\n")
+            f.write(self._format_page(page_number, content))
+    
+    def append_pages_to_file(self, pages: list, page_range: str = ""):
+        """将多页内容一次性追加到结果文件，pages为按页码排列的(页码, 内容)列表"""
+        text = ''.join(
+            self._format_page(page_number, content)
+            for page_number, content in pages if content
+        )
+        if not text:
+            return
+        
+        output_file = os.path.join(
+            self.pdf_output_dir,
+            f"{self.pdf_name}{page_range}_literary.txt"
+        )
+        
+        with open(output_file, "a", encoding="utf-8") as f:
+            f.write(text)
+    
+    def append_to_file_stream(self, page_number: int, chunks: Iterable[str], page_range: str = ""):
+        """边接收模型输出边追加到结果文件"""
+        output_file = os.path.join(
+            self.pdf_output_dir,
+            f"{self.pdf_name}{page_range}_literary.txt"
+        )
+        
+        with open(output_file, "a", encoding="utf-8") as f:
+            header_written = False
+            for chunk in chunks:
+                # 收到第一段输出时才写入页眉，没有内容的页面不写入
+                if not header_written:
+                    f.write(f"\n=== 第{page_number}页 ===\n")
+                    header_written = True
+                f.write(chunk)
+            if header_written:
+                f.write("\n")
 
 def process_pages(
     model_config: dict, 
     start_page: int = None, 
     end_page: int = None, 
     storage_mode: str = "append",
-    dump_interval: int = 10
+    dump_interval: int = 10,
+    max_concurrency: int = 4,
+    pages_per_request: int = 1,
+    use_cache: bool = True,
+    model_adapter: ModelAdapter = None
 ):
     """
     处理指定范围的页面并提取文学性句子
     
     Args:
-        model_config: 模型配置信息，包含模型类型和相关密钥
+        model_config: 模型配置信息，包含模型类型和相关密钥，
+            可选rpm指定每分钟最多请求数（默认60）
         start_page: 起始页码（从1开始），如果为None则从第一页开始
         end_page: 结束页码（包含），如果为None则处理到最后一页
         storage_mode: 存储模式，可选值：
             - "append": 边处理边追加到同一个文件（默认）
             - "batch": 按批次存储，最后合并
+            - "stream": 逐页顺序请求，边接收模型输出边追加到同一个文件，
+              忽略max_concurrency和pages_per_request
         dump_interval: 使用batch模式时，多少页保存一次
+        max_concurrency: 同时发起的模型请求数，结果仍按页码顺序写入
+        pages_per_request: 每次模型请求合并的页数（建议4-8），为1时逐页请求
+        use_cache: 是否复用缓存中相同输入的提取结果，避免重复调用模型
+        model_adapter: 已创建的模型适配器，处理多个文件时可传入同一个适配器；
+            为None时根据model_config获取
     """
-    try:
-        model_adapter = create_model_adapter(**model_config)
-        extractor = LiteraryExtractor(model_adapter)
-    except Exception as e:
-        print(f"创建模型适配器失败: {str(e)}")
-        return
+    if model_adapter is None:
+        try:
+            model_adapter = get_model_adapter(
+                model_config['model_type'],
+                model_config.get('api_key'),
+                model_config.get('secret_key')
+            )
+        except Exception as e:
+            print(f"创建模型适配器失败: {str(e)}")
+            return
     
     sep_pages_dir = "sep_pages"
     output_dir = "output"
+    cache_dir = "cache"
     
     os.makedirs(output_dir, exist_ok=True)
     
-    for pdf_dir in os.listdir(sep_pages_dir):
-        pdf_path = os.path.join(sep_pages_dir, pdf_dir)
-        if not os.path.isdir(pdf_path):
-            continue
-        
-        # 获取所有页面文件并按数字顺序排序
-        def get_page_number(filename):
-            # 从文件名中提取页码数字
-            try:
-                return int(''.join(filter(str.isdigit, filename.split('_')[1].split('.')[0])))
-            except (IndexError, ValueError):
-                return 0
-                
-        page_files = [f for f in os.listdir(pdf_path) if f.endswith('.json')]
-        page_files.sort(key=get_page_number)  # 按页码数字排序
+    cache = ResponseCache(cache_dir) if use_cache else None
+    # 所有工作线程共用一个限流器，避免超出API的每分钟请求数限制
+    rate_limiter = RateLimiter(model_config.get('rpm', 60))
+    extractor = LiteraryExtractor(model_adapter, cache, rate_limiter)
+    
+    try:
+        # scandir返回的目录项自带类型信息，无需再逐个stat
+        with os.scandir(sep_pages_dir) as it:
+            book_entries = [entry for entry in it if entry.is_dir()]
         
-        if not page_files:
-            continue
+        for book_entry in book_entries:
+            pdf_dir = book_entry.name
+            pdf_path = book_entry.path
             
-        # 确定实际的起始和结束页码
-        total_pages = len(page_files)
-        actual_start = 1 if start_page is None else max(1, min(start_page, total_pages))
-        actual_end = total_pages if end_page is None else min(end_page, total_pages)
-        
-        if actual_start > actual_end:
-            print(f"错误：起始页码（{actual_start}）大于结束页码（{actual_end}）")
-            continue
-        
-        # 创建输出管理器
-        page_range = f"_pages_{actual_start}-{actual_end}"
-        output_manager = OutputManager(output_dir, pdf_dir, dump_interval)
+            chunks_db = os.path.join(pdf_path, 'chunks.db')
+            if os.path.exists(chunks_db):
+                # EPUB：所有文本块保存在同一个SQLite数据库中
+                conn = sqlite3.connect(chunks_db)
+                try:
+                    total_pages = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+                finally:
+                    conn.close()
+            else:
+                # PDF：每页保存在单独的JSON文件中，创建页码到文件名的映射
+                chunks_db = None
+                page_file_map = {}
+                with os.scandir(pdf_path) as it:
+                    for entry in it:
+                        match = _PAGE_FILE_RE.search(entry.name)
+                        if match:
+                            page_file_map[int(match.group(1))] = entry.name
+                total_pages = len(page_file_map)
             
-        print(f"正在处理书籍: {pdf_dir} (第{actual_start}页到第{actual_end}页)")
-        
-        # 创建页码到文件名的映射
-        page_file_map = {get_page_number(f): f for f in page_files}
-        
-        pages_processed = 0
-        # 只处理指定范围内的页面
-        for current_page in range(actual_start, actual_end + 1):
-            if current_page not in page_file_map:
-                print(f"警告：找不到第{current_page}页的文件")
+            if not total_pages:
                 continue
                 
-            page_file = page_file_map[current_page]
-            page_path = os.path.join(pdf_path, page_file)
+            # 确定实际的起始和结束页码
+            actual_start = 1 if start_page is None else max(1, min(start_page, total_pages))
+            actual_end = total_pages if end_page is None else min(end_page, total_pages)
             
-            with open(page_path, "r", encoding="utf-8") as f:
-                page_data = json.load(f)
+            if actual_start > actual_end:
+                print(f"错误：起始页码（{actual_start}）大于结束页码（{actual_end}）")
+                continue
+            
+            # 创建输出管理器
+            page_range = f"_pages_{actual_start}-{actual_end}"
+            output_manager = OutputManager(output_dir, pdf_dir, dump_interval)
                 
-            print(f"正在处理页面 {current_page}")
+            print(f"正在处理书籍: {pdf_dir} (第{actual_start}页到第{actual_end}页)")
             
-            literary_sentences = extractor.extract_literary_sentences(page_data['content'])
+            if chunks_db:
+                # 只读取指定范围内的文本块
+                conn = sqlite3.connect(chunks_db)
+                try:
+                    page_contents = dict(conn.execute(
+                        "SELECT chunk_index, content FROM chunks "
+                        "WHERE chunk_index BETWEEN ? AND ? ORDER BY chunk_index",
+                        (actual_start, actual_end)
+                    ))
+                finally:
+                    conn.close()
+                available_pages = page_contents
+            else:
+                available_pages = page_file_map
             
-            if storage_mode == "batch":
-                # 批量模式：收集内容
-                output_manager.add_content(current_page, literary_sentences)
-                pages_processed += 1
+            def load_page_content(current_page):
+                if chunks_db:
+                    return page_contents[current_page]
+                page_path = os.path.join(pdf_path, page_file_map[current_page])
+                return load_json(page_path)['content']
+            
+            def extract_group(group):
+                texts = []
+                for current_page in group:
+                    texts.append(load_page_content(current_page))
+                    print(f"正在处理页面 {current_page}")
                 
-                # 达到dump间隔时保存
-                if pages_processed % dump_interval == 0:
-                    output_manager.dump_interval_batch()
+                if len(group) == 1:
+                    results = [extractor.extract_literary_sentences(texts[0])]
+                else:
+                    results = extractor.batch_extract_literary_sentences(texts)
+                return list(zip(group, results))
+            
+            # 只处理指定范围内的页面
+            pages = []
+            for current_page in range(actual_start, actual_end + 1):
+                if current_page not in available_pages:
+                    print(f"警告：找不到第{current_page}页的文件")
+                    continue
+                pages.append(current_page)
+            
+            # 每pages_per_request页合并为一次模型请求
+            group_size = max(1, pages_per_request)
+            groups = [pages[i:i + group_size] for i in range(0, len(pages), group_size)]
+            
+            pages_processed = 0
+            if storage_mode == "stream":
+                # 流式模式：逐页顺序处理，边接收模型输出边写入文件
+                for current_page in pages:
+                    text = load_page_content(current_page)
+                    print(f"正在处理页面 {current_page}")
+                    output_manager.append_to_file_stream(
+                        current_page,
+                        extractor.extract_literary_sentences_stream(text),
+                        page_range
+                    )
             else:
-                # 追加模式：直接写入文件
-                output_manager.append_to_file(
-                    current_page, 
-                    literary_sentences,
-                    page_range
-                )
+                executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+                futures = [executor.submit(extract_group, group) for group in groups]
+                ready_pages = []
+                try:
+                    # 按提交顺序取结果，保证按页码顺序写入
+                    for i, future in enumerate(futures):
+                        for current_page, literary_sentences in future.result():
+                            if storage_mode == "batch":
+                                # 批量模式：收集内容
+                                output_manager.add_content(current_page, literary_sentences)
+                                pages_processed += 1
+                                
+                                # 达到dump间隔时保存
+                                if pages_processed % dump_interval == 0:
+                                    output_manager.dump_interval_batch()
+                            else:
+                                ready_pages.append((current_page, literary_sentences))
+                        
+                        # 追加模式：下一组尚未完成时，将已就绪的页面一次性写入文件
+                        if ready_pages and (i + 1 == len(futures) or not futures[i + 1].done()):
+                            output_manager.append_pages_to_file(ready_pages, page_range)
+                            ready_pages = []
+                except BaseException:
+                    # 某一组出错时取消尚未开始的请求，不再继续调用模型，并写入已就绪的页面
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    output_manager.append_pages_to_file(ready_pages, page_range)
+                    raise
+                finally:
+                    executor.shutdown()
             
-            time.sleep(1)
-        
-        # 批量模式：最终合并所有文件
-        if storage_mode == "batch":
-            output_manager.merge_and_cleanup(page_range)
-        
-        print(f"完成处理: {pdf_dir} (第{actual_start}页到第{actual_end}页)")
+            # 批量模式：最终合并所有文件
+            if storage_mode == "batch":
+                output_manager.merge_and_cleanup(page_range)
+            
+            print(f"完成处理: {pdf_dir} (第{actual_start}页到第{actual_end}页)")
+    finally:
+        if cache is not None:
+            cache.close()
 
 if __name__ == "__main__":
     # 示例配置
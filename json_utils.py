@@ -0,0 +1,56 @@
+import os
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库json
+    orjson = None
+
+def dumps(obj) -> bytes:
+    """将对象序列化为UTF-8编码的紧凑JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    """解析JSON字符串或UTF-8字节串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump_json(obj, path: str):
+    """将对象以紧凑JSON格式写入文件，先写临时文件再替换，中途出错不会留下不完整的文件"""
+    data = dumps(obj)
+    # 临时文件与目标文件在同一目录，名称按进程和线程区分，多个写入者互不冲突
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def load_json(path: str):
+    """从文件读取JSON"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+# 按文件修改时间缓存已解析的JSON：path -> (mtime_ns, 解析结果)
+_json_cache = {}
+
+def load_json_cached(path: str):
+    """读取JSON文件，文件未修改时直接返回上次的解析结果（调用方不应修改返回的对象）"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    data = load_json(path)
+    _json_cache[path] = (mtime, data)
+    return data
+
+def invalidate_json_cache(path: str):
+    """文件被写入后调用，丢弃该文件的缓存"""
+    _json_cache.pop(path, None)
@@ -205,11 +205,15 @@ def main():
     
     # 获取存储模式
     while True:
-        storage_mode = input("\n请选择存储模式:\n1. 边处理边追加到同一个文件（默认）\n2. 按批次存储并最终合并\n请输入选项 [1/2]: ").strip()
+        storage_mode = input("\n请选择存储模式:\n1. 边处理边追加到同一个文件（默认）\n2. 按批次存储并最终合并\n3. 逐页请求，边接收模型输出边写入文件\n请输入选项 [1/2/3]: ").strip()
         if not storage_mode or storage_mode == "1":
             storage_mode = "append"
             dump_interval = 10  # 默认值，实际不会使用
             break
+        elif storage_mode == "3":
+            storage_mode = "stream"
+            dump_interval = 10  # 默认值，实际不会使用
+            break
         elif storage_mode == "2":
             storage_mode = "batch"
             while True:
@@ -1,18 +1,12 @@
 import os
-import json
+import queue
 import shutil
+import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog
-from extract_literary import (
-    OpenAIAdapter, DeepseekAdapter, 
-    ErnieAdapter, QianwenAdapter,
-    LiteraryExtractor, process_pages
-)
-from pdf_parse import parse_pdf
-from epub_parse import parse_epub
-from test_interface import TestInterface  # 导入测试界面类
+from test_interface import ConfigMixin, TestInterface  # 导入测试界面类
 
-class MainInterface:
+class MainInterface(ConfigMixin):
     def __init__(self, root):
         self.root = root
         self.root.title("文学句子提取工具")
@@ -131,6 +125,8 @@ class MainInterface:
                        variable=self.storage_mode).grid(row=0, column=1)
         ttk.Radiobutton(process_frame, text="按批次存储", value="batch", 
                        variable=self.storage_mode).grid(row=0, column=2)
+        ttk.Radiobutton(process_frame, text="边输出边写入", value="stream", 
+                       variable=self.storage_mode).grid(row=0, column=3)
         
         # 批次大小
         ttk.Label(process_frame, text="批次大小:").grid(row=1, column=0, sticky=tk.W)
@@ -144,7 +140,7 @@ class MainInterface:
         ttk.Label(process_frame, text="(格式: 起始页-结束页，留空处理全部)").grid(row=2, column=2)
         
         # 开始处理按钮
-        ttk.Button(process_frame, text="开始处理", command=self.start_processing).grid(row=3, column=0, columnspan=3, pady=10)
+        ttk.Button(process_frame, text="开始处理", command=self.start_processing).grid(row=3, column=0, columnspan=4, pady=10)
 
     def setup_log_section(self, parent):
         """设置日志显示区域"""
@@ -157,48 +153,12 @@ class MainInterface:
         # 配置日志区域可扩展
         log_frame.grid_rowconfigure(0, weight=1)
         log_frame.grid_columnconfigure(0, weight=1)
-
-    def load_config(self):
-        """加载配置文件"""
-        try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                model_configs = config.get('model_configs', {})
-                current_model = self.model_var.get()
-                if current_model in model_configs:
-                    self.api_key.set(model_configs[current_model].get('api_key', ''))
-                    if current_model == 'ernie':
-                        self.secret_key.set(model_configs[current_model].get('secret_key', ''))
-        except FileNotFoundError:
-            pass
-
-    def save_config(self):
-        """保存配置"""
-        try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            config = {'model_configs': {}}
-        
-        current_model = self.model_var.get()
-        config['model_configs'][current_model] = {
-            'model_type': current_model,
-            'api_key': self.api_key.get()
-        }
-        if current_model == 'ernie':
-            config['model_configs'][current_model]['secret_key'] = self.secret_key.get()
-        
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
-
-    def on_model_change(self, event=None):
-        """模型变更处理"""
-        current_model = self.model_var.get()
-        if current_model == 'ernie':
-            self.secret_entry.grid()
-        else:
-            self.secret_entry.grid_remove()
-        self.load_config()
+        
+        # 后台处理线程通过队列传递日志和错误提示，由主线程定时取出显示
+        self.processing_thread = None
+        self.log_queue = queue.Queue()
+        self.error_queue = queue.Queue()
+        self.root.after(100, self.poll_worker_queues)
 
     def select_system_files(self):
         """从系统选择文件"""
@@ -234,9 +194,13 @@ class MainInterface:
         """刷新文件列表"""
         self.file_listbox.delete(0, tk.END)
         if os.path.exists('books'):
-            for file in sorted(os.listdir('books')):
-                if file.lower().endswith(('.pdf', '.epub')):
-                    self.file_listbox.insert(tk.END, file)
+            files = sorted(
+                entry.name for entry in os.scandir('books')
+                if entry.name.lower().endswith(('.pdf', '.epub'))
+            )
+            # 一次插入全部文件名
+            if files:
+                self.file_listbox.insert(tk.END, *files)
 
     def start_processing(self):
         """开始处理文件"""
@@ -246,11 +210,10 @@ class MainInterface:
             tk.messagebox.showwarning("警告", "请选择要处理的文件")
             return
         
-        # 创建模型配置
-        model_config = {
-            'model_type': self.model_var.get(),
-            'api_key': self.api_key.get()
-        }
+        # 创建模型配置，以config.json中保存的设置（如rpm）为基础，界面上的密钥优先
+        model_config = self.get_saved_model_config()
+        model_config['model_type'] = self.model_var.get()
+        model_config['api_key'] = self.api_key.get()
         if model_config['model_type'] == 'ernie':
             model_config['secret_key'] = self.secret_key.get()
         
@@ -271,9 +234,46 @@ class MainInterface:
                 tk.messagebox.showerror("错误", "页码范围格式错误")
                 return
         
-        # 处理选中的文件
-        for idx in selected_indices:
-            filename = self.file_listbox.get(idx)
+        try:
+            dump_interval = int(self.batch_size.get())
+        except ValueError:
+            tk.messagebox.showerror("错误", "批次大小格式错误")
+            return
+        
+        if self.processing_thread and self.processing_thread.is_alive():
+            tk.messagebox.showwarning("警告", "正在处理中，请等待当前任务完成")
+            return
+        
+        # 在主线程读取界面上的选项，耗时的解析和提取放到后台线程中进行
+        filenames = [self.file_listbox.get(idx) for idx in selected_indices]
+        self.processing_thread = threading.Thread(
+            target=self.process_files,
+            args=(filenames, model_config, start_page, end_page,
+                  self.storage_mode.get(), dump_interval),
+            daemon=True
+        )
+        self.processing_thread.start()
+
+    def process_files(self, filenames, model_config, start_page, end_page, storage_mode, dump_interval):
+        """在后台线程中依次解析文件并提取文学句子"""
+        # 解析和模型相关的模块较重，首次开始处理时再导入，加快界面启动
+        from extract_literary import get_model_adapter, process_pages
+        from pdf_parse import parse_pdf
+        from epub_parse import parse_epub
+        
+        # 所有文件共用一个模型适配器
+        try:
+            model_adapter = get_model_adapter(
+                model_config['model_type'],
+                model_config['api_key'],
+                model_config.get('secret_key')
+            )
+        except Exception as e:
+            self.log(f"创建模型适配器失败: {str(e)}")
+            self.error_queue.put(f"创建模型适配器失败:\n{str(e)}")
+            return
+        
+        for filename in filenames:
             file_path = os.path.join('books', filename)
             
             try:
@@ -293,20 +293,42 @@ class MainInterface:
                     model_config,
                     start_page=start_page,
                     end_page=end_page,
-                    storage_mode=self.storage_mode.get(),
-                    dump_interval=int(self.batch_size.get())
+                    storage_mode=storage_mode,
+                    dump_interval=dump_interval,
+                    model_adapter=model_adapter
                 )
                 
                 self.log(f"完成处理: {filename}")
             except Exception as e:
                 self.log(f"处理出错: {str(e)}")
-                tk.messagebox.showerror("错误", f"处理 {filename} 时出错:\n{str(e)}")
+                self.error_queue.put(f"处理 {filename} 时出错:\n{str(e)}")
 
     def log(self, message):
-        """添加日志信息"""
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update()
+        """添加日志信息，可在任意线程中调用"""
+        self.log_queue.put(message)
+
+    def poll_worker_queues(self):
+        """在主线程中显示后台线程产生的日志和错误提示"""
+        # 取出当前积累的全部日志，一次插入并滚动到底部
+        messages = []
+        while True:
+            try:
+                messages.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if messages:
+            messages.append("")
+            self.log_text.insert(tk.END, "\n".join(messages))
+            self.log_text.see(tk.END)
+        
+        while True:
+            try:
+                error = self.error_queue.get_nowait()
+            except queue.Empty:
+                break
+            tk.messagebox.showerror("错误", error)
+        
+        self.root.after(100, self.poll_worker_queues)
 
 def main():
     root = tk.Tk()
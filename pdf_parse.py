@@ -1,8 +1,105 @@
 import os
+import re
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 import fitz  # PyMuPDF
-import json
+from json_utils import dump_json
 
-def parse_pdf(pdf_path, output_dir):
+# 句末标点，页面以这些字符结尾时认为没有跨页的句子
+_END_PUNCT_RE = re.compile(r'[。！？.!?]\Z')
+
+def _ends_with_punct(text):
+    """判断文本是否以句末标点结尾，只从最后一个字符开始匹配，空文本返回False"""
+    return _END_PUNCT_RE.match(text, len(text) - 1) is not None
+
+# 纯文本提取选项，沿用PyMuPDF对"text"格式的默认选项，提取内容与get_text()一致
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT
+
+# 子进程以spawn方式启动：parse_pdf可能在图形界面的后台线程中调用，
+# 在多线程进程中fork可能导致子进程死锁
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# 每个进程一次提取的页数
+EXTRACT_BATCH_PAGES = 32
+
+# 后台写入页面文件的线程数，以及最多同时等待写入的页数
+WRITE_WORKERS = 8
+MAX_PENDING_WRITES = 16
+
+def _join_cross_page(prev_text, current_text, next_text):
+    """
+    处理跨页文本：把上一页末尾和下一页开头未结束的段落拼接到当前页
+    
+    Args:
+        prev_text: 上一页文本，第一页时为空
+        current_text: 当前页文本
+        next_text: 下一页文本，最后一页时为空
+    """
+    # 如果不是第一页，且上一页的最后一个字符不是标点符号，可能存在跨页；
+    # 大多数页面以标点结尾，在这里就跳过，不再截取段落
+    if current_text and prev_text and not _ends_with_punct(prev_text):
+        # 将上一页的最后一段添加到当前页的开头
+        last_paragraph = prev_text.rpartition('\n')[2]
+        if last_paragraph:
+            current_text = last_paragraph + current_text
+    
+    # 如果不是最后一页，且当前页的最后一个字符不是标点符号，可能存在跨页
+    if current_text and next_text and not _ends_with_punct(current_text):
+        # 将下一页的第一段添加到当前页的结尾
+        first_paragraph = next_text.partition('\n')[0]
+        if first_paragraph:
+            current_text = current_text + first_paragraph
+    
+    return current_text
+
+def _extract_page_text(doc, page_num):
+    """提取单页文本，出错时返回空文本作为占位符"""
+    try:
+        return doc[page_num].get_text("text", flags=TEXT_FLAGS, sort=False).strip()
+    except Exception as e:
+        print(f"提取第 {page_num + 1} 页文本时出错: {str(e)}")
+        return ""
+
+def _extract_range(pdf_path, start, end):
+    """在子进程中单独打开PDF，提取[start, end)范围内各页的文本"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [_extract_page_text(doc, page_num) for page_num in range(start, end)]
+    finally:
+        doc.close()
+
+def _iter_page_texts(pdf_path, doc, total_pages, max_workers=None):
+    """按页码顺序逐页返回文本，页数较多时分段交给多个进程并行提取"""
+    if max_workers == 1 or total_pages <= EXTRACT_BATCH_PAGES:
+        for page_num in range(total_pages):
+            yield _extract_page_text(doc, page_num)
+        return
+    
+    workers = max_workers or os.cpu_count() or 1
+    starts = iter(range(0, total_pages, EXTRACT_BATCH_PAGES))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as pool:
+        def submit(start):
+            end = min(start + EXTRACT_BATCH_PAGES, total_pages)
+            return pool.submit(_extract_range, pdf_path, start, end)
+        
+        # 最多同时提交2倍进程数的分段，已提取但未处理的文本量与PDF大小无关
+        pending = deque(submit(start) for start in islice(starts, 2 * workers))
+        try:
+            # 按提交顺序取结果，每取走一段再提交下一段
+            while pending:
+                texts = pending.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(submit(start))
+                yield from texts
+        finally:
+            # 提前结束时取消尚未开始的分段
+            for future in pending:
+                future.cancel()
+
+def parse_pdf(pdf_path, output_dir, max_workers=None):
     """
     解析PDF文件并将每页内容保存到单独的JSON文件中，
     同时处理跨页文本问题
@@ -10,105 +107,74 @@ def parse_pdf(pdf_path, output_dir):
     Args:
         pdf_path: PDF文件路径
         output_dir: 输出目录路径
+        max_workers: 并行提取文本的进程数，默认使用全部CPU核心，为1时在当前进程中依次提取
     """
     # 打开PDF文件
     doc = fitz.open(pdf_path)
     
-    # 获取PDF文件名（不含扩展名）
-    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    
-    # 为每个PDF创建单独的目录
-    pdf_output_dir = os.path.join(output_dir, pdf_name)
-    os.makedirs(pdf_output_dir, exist_ok=True)
-    
-    # 计算页码宽度（用于生成固定宽度的页码）
-    total_pages = len(doc)
-    page_number_width = len(str(total_pages))
-    
-    # 存储所有页面的文本，用于处理跨页文本
-    all_pages_text = []
-    
-    # 第一遍：收集所有页面的文本
-    print(f"正在提取文本，总页数：{total_pages}")
-    for page_num in range(total_pages):
+    try:
+        # 获取PDF文件名（不含扩展名）
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        
+        # 为每个PDF创建单独的目录
+        pdf_output_dir = os.path.join(output_dir, pdf_name)
+        os.makedirs(pdf_output_dir, exist_ok=True)
+        
+        # 计算页码宽度（用于生成固定宽度的页码）
+        total_pages = len(doc)
+        page_number_width = len(str(total_pages))
+        page_file_name = f"page_{{:0{page_number_width}d}}.json".format
+        
+        # 单遍处理：只保留上一页、当前页和下一页的文本，用于处理跨页文本
+        print(f"正在处理，总页数：{total_pages}")
+        page_texts = _iter_page_texts(pdf_path, doc, total_pages, max_workers)
+        # 页面文件由后台线程写入，与下一页的提取和处理重叠进行
+        writer = ThreadPoolExecutor(max_workers=WRITE_WORKERS)
+        pending_writes = deque()
         try:
-            page = doc[page_num]
-            text = page.get_text()
-            all_pages_text.append(text.strip())
-            if (page_num + 1) % 10 == 0:
-                print(f"已处理 {page_num + 1} 页")
-        except Exception as e:
-            print(f"提取第 {page_num + 1} 页文本时出错: {str(e)}")
-            all_pages_text.append("")  # 添加空文本作为占位符
-    
-    # 第二遍：处理文本并保存，考虑跨页情况
-    print("\n正在处理跨页文本...")
-    for page_num in range(total_pages):
-        try:
-            current_text = all_pages_text[page_num]
-            
-            # 处理跨页文本
-            # 如果不是第一页，检查上一页的最后一段
-            if page_num > 0 and current_text and all_pages_text[page_num - 1]:
-                prev_text = all_pages_text[page_num - 1]
-                # 如果上一页的最后一个字符不是标点符号，可能存在跨页
-                if prev_text and not prev_text[-1] in '。！？.!?':
-                    # 获取上一页的最后一段
-                    prev_paragraphs = prev_text.split('\n')
-                    last_paragraph = prev_paragraphs[-1] if prev_paragraphs else ""
-                    # 将上一页的最后一段添加到当前页的开头
-                    if last_paragraph:
-                        current_text = last_paragraph + current_text
-            
-            # 如果不是最后一页，检查下一页的第一段
-            if page_num < total_pages - 1 and current_text and all_pages_text[page_num + 1]:
-                next_text = all_pages_text[page_num + 1]
-                # 如果当前页的最后一个字符不是标点符号，可能存在跨页
-                if current_text and not current_text[-1] in '。！？.!?':
-                    # 获取下一页的第一段
-                    next_paragraphs = next_text.split('\n')
-                    first_paragraph = next_paragraphs[0] if next_paragraphs else ""
-                    # 将下一页的第一段添加到当前页的结尾
-                    if first_paragraph:
-                        current_text = current_text + first_paragraph
-            
-            # 创建包含页面信息的字典
-            page_data = {
-                "page_number": page_num + 1,
-                "content": current_text,
-                "source_pdf": pdf_name,
-                "total_pages": total_pages
-            }
-            
-            # 使用固定宽度的页码格式保存文件
-            output_file = os.path.join(
-                pdf_output_dir, 
-                f"page_{str(page_num + 1).zfill(page_number_width)}.json"
-            )
-            
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(page_data, f, ensure_ascii=False, indent=4)
-            
-            if (page_num + 1) % 10 == 0:
-                print(f"已保存 {page_num + 1} 页")
+            prev_text = ""
+            curr_text = next(page_texts, "")
+            for page_num in range(total_pages):
+                # 最后一页之后没有下一页，返回空文本
+                next_text = next(page_texts, "")
                 
-        except Exception as e:
-            print(f"处理第 {page_num + 1} 页时出错: {str(e)}")
-            # 保存空内容，确保页面完整性
-            page_data = {
-                "page_number": page_num + 1,
-                "content": "",
-                "source_pdf": pdf_name,
-                "total_pages": total_pages
-            }
-            output_file = os.path.join(
-                pdf_output_dir, 
-                f"page_{str(page_num + 1).zfill(page_number_width)}.json"
-            )
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(page_data, f, ensure_ascii=False, indent=4)
-    
-    doc.close()
+                try:
+                    current_text = _join_cross_page(prev_text, curr_text, next_text)
+                except Exception as e:
+                    print(f"处理第 {page_num + 1} 页时出错: {str(e)}")
+                    # 保存空内容，确保页面完整性
+                    current_text = ""
+                
+                # 创建包含页面信息的字典
+                page_data = {
+                    "page_number": page_num + 1,
+                    "content": current_text,
+                    "source_pdf": pdf_name,
+                    "total_pages": total_pages
+                }
+                
+                # 使用固定宽度的页码格式保存文件
+                output_file = os.path.join(pdf_output_dir, page_file_name(page_num + 1))
+                
+                pending_writes.append(writer.submit(dump_json, page_data, output_file))
+                # 限制排队中的页面数，同时及时抛出写入错误
+                if len(pending_writes) >= MAX_PENDING_WRITES:
+                    pending_writes.popleft().result()
+                
+                if (page_num + 1) % 10 == 0:
+                    print(f"已处理 {page_num + 1} 页")
+                
+                # 窗口后移一页
+                prev_text, curr_text = curr_text, next_text
+            
+            for future in pending_writes:
+                future.result()
+        finally:
+            # 出错时同样关闭提取进程池和写入线程池
+            page_texts.close()
+            writer.shutdown(wait=True)
+    finally:
+        doc.close()
     print("PDF处理完成")
 
 def process_all_pdfs():
@@ -119,13 +185,36 @@ def process_all_pdfs():
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
     
-    # 遍历所有PDF文件
-    for filename in os.listdir(pdf_dir):
-        if filename.lower().endswith('.pdf'):
-            pdf_path = os.path.join(pdf_dir, filename)
+    pdf_files = [
+        entry.name for entry in os.scandir(pdf_dir)
+        if entry.is_file() and entry.name.lower().endswith('.pdf')
+    ]
+    if not pdf_files:
+        return
+    
+    # 只有一个文件时在当前进程处理，由parse_pdf按页并行提取
+    if len(pdf_files) == 1:
+        filename = pdf_files[0]
+        print(f"正在处理: {filename}")
+        try:
+            parse_pdf(os.path.join(pdf_dir, filename), output_dir)
+            print(f"完成处理: {filename}")
+        except Exception as e:
+            print(f"处理 {filename} 时出错: {str(e)}")
+        return
+    
+    # 多个文件时每个进程处理一个文件，文件内不再另开进程池
+    max_workers = min(os.cpu_count() or 1, len(pdf_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for filename in pdf_files:
             print(f"正在处理: {filename}")
+            pdf_path = os.path.join(pdf_dir, filename)
+            futures.append(pool.submit(parse_pdf, pdf_path, output_dir, 1))
+        
+        for filename, future in zip(pdf_files, futures):
             try:
-                parse_pdf(pdf_path, output_dir)
+                future.result()
                 print(f"完成处理: {filename}")
             except Exception as e:
                 print(f"处理 {filename} 时出错: {str(e)}")
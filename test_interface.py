@@ -1,13 +1,65 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import json
-from extract_literary import (
-    OpenAIAdapter, DeepseekAdapter, 
-    ErnieAdapter, QianwenAdapter,
-    LiteraryExtractor
-)
+from json_utils import load_json_cached, invalidate_json_cache
 
-class TestInterface:
+class ConfigMixin:
+    """
+    模型配置的加载和保存，由主界面和测试界面共用
+    
+    使用者需提供model_var、api_key、secret_key和secret_entry
+    """
+    def load_config(self):
+        """加载已保存的配置"""
+        try:
+            config = load_json_cached('config.json')
+            model_configs = config.get('model_configs', {})
+            current_model = self.model_var.get()
+            if current_model in model_configs:
+                self.api_key.set(model_configs[current_model].get('api_key', ''))
+                if current_model == 'ernie':
+                    self.secret_key.set(model_configs[current_model].get('secret_key', ''))
+        except FileNotFoundError:
+            pass
+    
+    def get_saved_model_config(self) -> dict:
+        """返回config.json中当前模型的配置副本，没有时返回空字典"""
+        try:
+            config = load_json_cached('config.json')
+        except FileNotFoundError:
+            return {}
+        return dict(config.get('model_configs', {}).get(self.model_var.get(), {}))
+    
+    def save_config(self):
+        """保存当前配置"""
+        try:
+            with open('config.json', 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {'model_configs': {}}
+        
+        current_model = self.model_var.get()
+        # 保留该模型配置中的其他设置（如rpm），只更新界面上的字段
+        model_entry = config.setdefault('model_configs', {}).setdefault(current_model, {})
+        model_entry['model_type'] = current_model
+        model_entry['api_key'] = self.api_key.get()
+        if current_model == 'ernie':
+            model_entry['secret_key'] = self.secret_key.get()
+        
+        with open('config.json', 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        invalidate_json_cache('config.json')
+    
+    def on_model_change(self, event=None):
+        """模型变更时的处理"""
+        current_model = self.model_var.get()
+        if current_model == 'ernie':
+            self.secret_entry.grid()
+        else:
+            self.secret_entry.grid_remove()
+        self.load_config()
+
+class TestInterface(ConfigMixin):
     def __init__(self, root, is_standalone=True):
         self.is_standalone = is_standalone
         
@@ -100,8 +152,8 @@ class TestInterface:
     def load_prompt_templates(self):
         """加载prompt模板"""
         try:
-            with open('prompt_templates.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
+            # 返回副本，增删模板时不会改动缓存中的内容
+            return dict(load_json_cached('prompt_templates.json'))
         except FileNotFoundError:
             return {
                 "默认文学提取": "你是一个专业的文学鉴赏家，善于发现文本中富有文学性的句子。这些句子应该具有优美的意境、独特的比喻、生动的描写或深刻的哲理。"
@@ -111,6 +163,7 @@ class TestInterface:
         """保存prompt模板"""
         with open('prompt_templates.json', 'w', encoding='utf-8') as f:
             json.dump(self.prompt_templates, f, ensure_ascii=False, indent=4)
+        invalidate_json_cache('prompt_templates.json')
     
     def update_template_list(self):
         """更新模板列表"""
@@ -163,65 +216,22 @@ class TestInterface:
             self.update_template_list()
             messagebox.showinfo("成功", "模板删除成功")
     
-    def load_config(self):
-        """加载已保存的配置"""
-        try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                model_configs = config.get('model_configs', {})
-                current_model = self.model_var.get()
-                if current_model in model_configs:
-                    self.api_key.set(model_configs[current_model].get('api_key', ''))
-                    if current_model == 'ernie':
-                        self.secret_key.set(model_configs[current_model].get('secret_key', ''))
-        except FileNotFoundError:
-            pass
-    
-    def save_config(self):
-        """保存当前配置"""
-        try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            config = {'model_configs': {}}
-        
-        current_model = self.model_var.get()
-        config['model_configs'][current_model] = {
-            'model_type': current_model,
-            'api_key': self.api_key.get()
-        }
-        if current_model == 'ernie':
-            config['model_configs'][current_model]['secret_key'] = self.secret_key.get()
-        
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
-    
-    def on_model_change(self, event=None):
-        """模型变更时的处理"""
-        current_model = self.model_var.get()
-        if current_model == 'ernie':
-            self.secret_entry.grid()
-        else:
-            self.secret_entry.grid_remove()
-        self.load_config()
-    
     def create_adapter(self):
         """创建模型适配器"""
-        model_type = self.model_var.get()
-        api_key = self.api_key.get()
-        
-        adapters = {
-            'openai': lambda: OpenAIAdapter(api_key),
-            'deepseek': lambda: DeepseekAdapter(api_key),
-            'ernie': lambda: ErnieAdapter(api_key, self.secret_key.get()),
-            'qianwen': lambda: QianwenAdapter(api_key)
-        }
+        # 模型相关模块较重，首次运行测试时再导入
+        from extract_literary import get_model_adapter
         
-        return adapters[model_type]()
+        model_type = self.model_var.get()
+        secret_key = self.secret_key.get() if model_type == 'ernie' else None
+        # 相同模型和密钥复用已创建的适配器
+        return get_model_adapter(model_type, self.api_key.get(), secret_key)
     
     def run_test(self):
         """运行测试"""
         try:
+            # 模型相关模块较重，首次运行测试时再导入
+            from extract_literary import LiteraryExtractor
+            
             # 保存当前配置
             self.save_config()
             